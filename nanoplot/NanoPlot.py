@@ -12,18 +12,27 @@ Input data can be given as one or multiple of:
 '''
 
 from os import path
+import io
 import logging
-import nanomath
 import numpy as np
-from scipy import stats
 import nanoplot.utils as utils
 import nanoplot.report as report
-from nanoget import get_input
-from nanoplot.filteroptions import filter_and_transform_data
+from nanoplot.filteroptions import filter_and_transform_data, length_filtered
 from nanoplot.version import __version__
-import nanoplotter
-import pickle
 import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from functools import partial
+from collections import Counter
+
+# columns of the DataFrame used by make_plots and the nanoplotter functions it calls
+PLOT_COLUMNS = ("lengths", "log_lengths", "quals", "mapQ", "percentIdentity",
+                "aligned_lengths", "aligned_quals", "channelIDs", "start_time", "duration",
+                "dataset", "length_filter")
+
+# DataFrame and row positions per barcode, set in main and inherited by forked barcode workers
+barcode_data = {}
 
 
 def main():
@@ -39,74 +48,86 @@ def main():
         utils.init_logs(args)
         # args.format = nanoplotter.check_valid_format(args.format)
         if args.pickle:
-            datadf = pickle.load(open(args.pickle, 'rb'))
+            datadf = utils.load_pickle(args.pickle)
         elif args.feather:
-            from nanoget import combine_dfs
-            from pandas import read_feather
-            datadf = combine_dfs([read_feather(p)
-                                 for p in args.feather], method="simple")
+            datadf = read_feathers(args.feather)
         else:
-            sources = {
-                "fastq": args.fastq,
-                "bam": args.bam,
-                "cram": args.cram,
-                "fastq_rich": args.fastq_rich,
-                "fastq_minimal": args.fastq_minimal,
-                "summary": args.summary,
-                "fasta": args.fasta,
-                "ubam": args.ubam,
-            }
-            datadf = get_input(
-                source=[n for n, s in sources.items() if s][0],
-                files=[f for f in sources.values() if f][0],
-                threads=args.threads,
-                readtype=args.readtype,
-                combine="simple",
-                barcoded=args.barcoded,
-                huge=args.huge,
-                keep_supp=not (args.no_supplementary))
+            datadf = None
+            huge_files = args.fastq or args.fasta or args.ubam
+            # nanoget refuses multiple huge input files, so leave that to get_input
+            if args.huge and huge_files and len(huge_files) == 1:
+                datadf = read_huge(huge_files[0], read_ids=bool(args.ubam))
+            if datadf is None:
+                from nanoget import get_input
+                sources = {
+                    "fastq": args.fastq,
+                    "bam": args.bam,
+                    "cram": args.cram,
+                    "fastq_rich": args.fastq_rich,
+                    "fastq_minimal": args.fastq_minimal,
+                    "summary": args.summary,
+                    "fasta": args.fasta,
+                    "ubam": args.ubam,
+                }
+                datadf = get_input(
+                    source=[n for n, s in sources.items() if s][0],
+                    files=[f for f in sources.values() if f][0],
+                    threads=args.threads,
+                    readtype=args.readtype,
+                    combine="simple",
+                    barcoded=args.barcoded,
+                    huge=args.huge,
+                    keep_supp=not (args.no_supplementary))
+        if args.barcoded:
+            datadf["barcode"] = datadf["barcode"].astype("category")
+            logging.info("Found {} barcodes".format(len(datadf["barcode"].cat.categories)))
+        # writing data and stats happens in the background while plotting
+        # a shallow copy protects against the columns added by filter_and_transform_data,
+        # which never writes into the existing columns
+        io_pool = ThreadPoolExecutor(max_workers=1)
+        rawdf = datadf.copy(deep=False)
+        io_jobs = []
         if args.store:
-            pickle.dump(
-                obj=datadf,
-                file=open(settings["path"] + "NanoPlot-data.pickle", 'wb'))
+            io_jobs.append(io_pool.submit(store_data, rawdf, settings))
         if args.raw:
-            datadf.to_csv(settings["path"] + "NanoPlot-data.tsv.gz",
-                          sep="\t",
-                          index=False,
-                          compression="gzip")
+            io_jobs.append(io_pool.submit(write_raw, rawdf, settings))
 
-        settings["statsfile"] = [make_stats(
-            datadf, settings, suffix="", tsv_stats=args.tsv_stats)]
+        stats_jobs = [io_pool.submit(
+            make_stats, rawdf, settings, suffix="", tsv_stats=args.tsv_stats)]
         datadf, settings = filter_and_transform_data(datadf, settings)
         if settings["filtered"]:  # Bool set when filter was applied in filter_and_transform_data()
-            settings["statsfile"].append(
-                make_stats(datadf[datadf["length_filter"]], settings,
-                           suffix="_post_filtering", tsv_stats=args.tsv_stats)
+            post_filtering = length_filtered(datadf)
+            stats_jobs.append(io_pool.submit(
+                make_stats, post_filtering, settings,
+                suffix="_post_filtering", tsv_stats=args.tsv_stats)
             )
 
         if args.barcoded:
-            main_path = settings["path"]
-            barcodes = list(datadf["barcode"].unique())
-            plots = []
-            for barc in barcodes:
-                logging.info("Processing {}".format(barc))
-                dfbarc = datadf[datadf["barcode"] == barc]
-                if len(dfbarc) > 5:
-                    settings["title"] = barc
-                    settings["path"] = path.join(
-                        args.outdir, args.prefix + barc + "_")
-                    plots.append(report.BarcodeTitle(barc))
-                    plots.extend(
-                        make_plots(dfbarc, settings)
-                    )
-                else:
-                    sys.stderr.write(
-                        "Found barcode {} less than 5x, ignoring...\n".format(barc))
-                    logging.info(
-                        "Found barcode {} less than 5 times, ignoring".format(barc))
-            settings["path"] = main_path
+            # don't fork the barcode workers while the background thread is alive
+            io_pool.shutdown()
+            barcode_data["df"] = datadf
+            barcode_data["rows"] = datadf.groupby("barcode", sort=False, observed=True).indices
+            barcodes = sorted(barcode_data["rows"], key=lambda b: barcode_data["rows"][b][0])
+            if "fork" in multiprocessing.get_all_start_methods():
+                # forked workers inherit barcode_data, only the barcode names are sent
+                # import the plotting modules once here rather than in every worker
+                import nanoplotter  # noqa: F401
+                import scipy.stats  # noqa: F401
+                with ProcessPoolExecutor(
+                        max_workers=args.threads,
+                        mp_context=multiprocessing.get_context("fork")) as executor:
+                    barcode_plots = list(executor.map(make_barcode_plots,
+                                                      barcodes,
+                                                      repeat(dict(settings, threads=1))))
+            else:
+                barcode_plots = [make_barcode_plots(barc, settings) for barc in barcodes]
+            plots = [p for plots_made in barcode_plots for p in plots_made]
         else:
             plots = make_plots(datadf, settings)
+        for job in io_jobs:
+            job.result()
+        settings["statsfile"] = [job.result() for job in stats_jobs]
+        io_pool.shutdown()
         make_report(plots, settings)
         logging.info("Finished!")
     except Exception as e:
@@ -120,7 +141,142 @@ def main():
         raise
 
 
+def make_barcode_plots(barc, settings):
+    '''
+    Create the plots for a single barcode, preceded by a title for the report
+    The reads are taken from barcode_data, barcodes with 5 or less reads are skipped
+    '''
+    logging.info("Processing {}".format(barc))
+    dfbarc = barcode_data["df"].take(barcode_data["rows"][barc])
+    if len(dfbarc) > 5:
+        settings = dict(settings,
+                        title=barc,
+                        path=path.join(settings["outdir"], settings["prefix"] + barc + "_"))
+        return [report.BarcodeTitle(barc)] + make_plots(dfbarc, settings)
+    else:
+        sys.stderr.write(
+            "Found barcode {} less than 5x, ignoring...\n".format(barc))
+        logging.info(
+            "Found barcode {} less than 5 times, ignoring".format(barc))
+        return []
+
+
+def read_huge(filename, read_ids=False):
+    '''
+    Extract read lengths and average qualities from one large fastq, fasta or unaligned bam
+    Using dnaio this is much faster than nanoget, returns None if dnaio is not available
+    Like nanoget, reads without qualities are dropped unless no read has qualities (fasta)
+    and read_ids adds the readIDs column as for an unaligned bam
+    '''
+    try:
+        import dnaio
+    except ImportError:
+        logging.info("dnaio not available, extracting data with nanoget.")
+        return None
+    import pandas as pd
+    names = []
+    lengths = []
+    quals = []
+    with dnaio.open(filename) as reads:
+        for read in reads:
+            if read_ids:
+                names.append(read.name)
+            lengths.append(len(read.sequence))
+            quals.append(utils.ave_qual(read.qualities_as_bytes()) if read.qualities else None)
+    data = {"readIDs": names} if read_ids else {}
+    data["quals"] = np.array(quals, dtype=np.float64)
+    data["lengths"] = np.array(lengths, dtype=np.int64)
+    datadf = pd.DataFrame(data) \
+        .dropna(axis="columns", how="all") \
+        .dropna(axis="index", how="any")
+    logging.info("Extracted {} reads with dnaio.".format(len(datadf)))
+    if len(datadf) == 0:
+        logging.critical("No reads retrieved.")
+        sys.exit("Fatal: No reads found in input.")
+    return datadf
+
+
+def read_feathers(feathers):
+    '''
+    Read one or more feather files in a single DataFrame
+    Multiple files are concatenated as arrow tables and converted to pandas once
+    '''
+    if len(feathers) == 1:
+        from pandas import read_feather
+        return read_feather(feathers[0])
+    import pyarrow as pa
+    from pyarrow import feather
+    tables = [feather.read_table(p) for p in feathers]
+    try:
+        table = pa.concat_tables(tables, promote_options="permissive")
+    except (TypeError, pa.ArrowInvalid):
+        # promote_options needs pyarrow>=14, pandas also combines types arrow can't unify
+        import pandas as pd
+        return pd.concat([t.to_pandas() for t in tables], ignore_index=True)
+    # the concatenated table must hold the only references for self_destruct to free memory
+    del tables
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def store_data(datadf, settings):
+    '''
+    Store the extracted data in a .nanopickle file, and in a feather file if pyarrow is available
+    Both can be used as input for a later run with --pickle or --feather
+    '''
+    utils.dump_pickle(datadf, settings["path"] + "NanoPlot-data.nanopickle")
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        logging.info("pyarrow not available, not storing data as feather.")
+    else:
+        datadf.reset_index(drop=True).to_feather(
+            settings["path"] + "NanoPlot-data.feather", compression="zstd")
+
+
+def write_raw(datadf, settings):
+    '''
+    Store the extracted data in a compressed tab separated file
+    pyarrow's multithreaded csv writer is used when available, otherwise pandas
+    '''
+    if settings["raw_zstd"]:
+        compression, rawfile = "zstd", settings["path"] + "NanoPlot-data.tsv.zst"
+    else:
+        compression, rawfile = "gzip", settings["path"] + "NanoPlot-data.tsv.gz"
+    try:
+        import pyarrow as pa
+        from pyarrow import csv
+    except ImportError:
+        pa = None
+    if pa is not None:
+        # format and quote like pandas does, pyarrow writes e.g. 14 for 14.0,
+        # 0.00001 for 1e-05, true for True and integers for timedeltas
+        formatted = datadf.select_dtypes(["timedelta", "floating", "bool"]).columns
+        try:
+            table = pa.Table.from_pandas(
+                datadf.assign(**{c: datadf[c].astype(str).where(datadf[c].notna())
+                                 for c in formatted}),
+                preserve_index=False)
+            # quoting_style needs pyarrow>=8
+            options = csv.WriteOptions(include_header=False, delimiter="\t", quoting_style="none")
+            with pa.CompressedOutputStream(rawfile, compression) as stream:
+                stream.write(("\t".join(table.column_names) + "\n").encode())
+                csv.write_csv(table, stream, options)
+            return
+        except (TypeError, pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            logging.info("Could not write raw data using pyarrow: {}".format(e))
+        # let pyarrow compress the pandas output, pandas needs zstandard for zstd
+        with pa.CompressedOutputStream(rawfile, compression) as stream:
+            with io.TextIOWrapper(stream, encoding="utf-8") as handle:
+                datadf.to_csv(handle, sep="\t", index=False)
+        return
+    datadf.to_csv(rawfile,
+                  sep="\t",
+                  index=False,
+                  compression=compression)
+
+
 def make_stats(datadf, settings, suffix, tsv_stats=True):
+    import nanomath
     statsfile = settings["path"] + "NanoStats" + suffix + ".txt"
     stats_df = nanomath.write_stats(
         datadfs=[datadf],
@@ -128,12 +284,12 @@ def make_stats(datadf, settings, suffix, tsv_stats=True):
         as_tsv=tsv_stats)
     logging.info("Calculated statistics")
     if settings["barcoded"]:
-        barcodes = list(datadf["barcode"].unique())
+        barcodes, datadfs = zip(*datadf.groupby("barcode", sort=False, observed=True))
         statsfile = settings["path"] + "NanoStats_barcoded.txt"
         stats_df = nanomath.write_stats(
-            datadfs=[datadf[datadf["barcode"] == b] for b in barcodes],
+            datadfs=list(datadfs),
             outputfile=statsfile,
-            names=barcodes,
+            names=list(barcodes),
             as_tsv=tsv_stats)
     return stats_df if tsv_stats else statsfile
 
@@ -143,229 +299,229 @@ def make_plots(datadf, settings):
     Call plotting functions from nanoplotter
     settings["lengths_pointer"] is a column in the DataFrame specifying which lengths to use
     '''
+    # imported here to keep the startup fast, e.g. for --help and --version
+    import nanoplotter
+    from scipy import stats
     color = nanoplotter.check_valid_color(settings["color"])
     colormap = nanoplotter.check_valid_colormap(settings["colormap"])
 
-    plotdict = {type: settings["plots"].count(
-        type) for type in ["kde", "hex", "dot", 'pauvre']}
+    plot_counts = Counter(settings["plots"])
+    plotdict = {kind: plot_counts[kind] for kind in ["kde", "hex", "dot", 'pauvre']}
     if "hex" in settings["plots"]:
         print(
             "WARNING: hex as part of --plots has been deprecated and will be ignored. To get the hex output, rerun with --legacy hex.")
 
     if settings["legacy"]:
-        plotdict_legacy = {plot: settings["legacy"].count(plot) for plot in [
-            "kde", "hex", "dot"]}
+        legacy_counts = Counter(settings["legacy"])
+        plotdict_legacy = {kind: legacy_counts[kind] for kind in ["kde", "hex", "dot"]}
     else:
         plotdict_legacy = {}
-    plots = []
+    tasks = []
+
+    # only keep the columns which are used for plotting, without duplicates
+    # projecting copies the data, so skip it when no column would be dropped
+    lengths_columns = (settings["lengths_pointer"].replace('log_', ''), settings["lengths_pointer"])
+    columns = [c for c in dict.fromkeys(PLOT_COLUMNS + lengths_columns) if c in datadf]
+    if len(columns) < len(datadf.columns):
+        datadf = datadf[columns]
+    fdf = length_filtered(datadf)
+    lengths = fdf[settings["lengths_pointer"].replace('log_', '')]
+    log_lengths = fdf[settings["lengths_pointer"]]
+    stat = None if settings["hide_stats"] else stats.pearsonr
 
     subdf = utils.subsample_datasets(datadf)
     if settings["N50"]:
-        n50 = nanomath.get_N50(np.sort(datadf["lengths"]))
+        n50 = utils.get_N50(datadf["lengths"])
     else:
         n50 = None
 
-    plots.extend(
-        nanoplotter.length_plots(
-            array=datadf[datadf["length_filter"]]["lengths"].astype('uint64'),
-            name="Read length",
-            path=settings["path"],
-            n50=n50,
+    tasks.append(partial(
+        nanoplotter.length_plots,
+        array=utils.integer_lengths(fdf["lengths"]),
+        name="Read length",
+        path=settings["path"],
+        n50=n50,
+        color=color,
+        title=settings["title"],
+        settings=settings))
+    if "quals" in datadf:
+        quals = fdf["quals"]
+        tasks.append(partial(
+            nanoplotter.scatter,
+            x=lengths,
+            y=quals,
+            legacy=plotdict_legacy,
+            names=['Read lengths', 'Average read quality'],
+            path=settings["path"] + "LengthvsQualityScatterPlot",
             color=color,
+            colormap=colormap,
+            plots=plotdict,
             title=settings["title"],
-            settings=settings)
-    )
-    logging.info("Created length plots")
-    if "quals" in datadf:
-        plots.extend(
-            nanoplotter.scatter(
-                x=datadf[datadf["length_filter"]
-                         ][settings["lengths_pointer"].replace('log_', '')],
-                y=datadf[datadf["length_filter"]]["quals"],
+            settings=settings))
+        if settings["logBool"]:
+            tasks.append(partial(
+                nanoplotter.scatter,
+                x=log_lengths,
+                y=quals,
                 legacy=plotdict_legacy,
                 names=['Read lengths', 'Average read quality'],
                 path=settings["path"] + "LengthvsQualityScatterPlot",
                 color=color,
                 colormap=colormap,
                 plots=plotdict,
+                log=True,
                 title=settings["title"],
-                settings=settings)
-        )
-        if settings["logBool"]:
-            plots.extend(
-                nanoplotter.scatter(
-                    x=datadf[datadf["length_filter"]
-                             ][settings["lengths_pointer"]],
-                    y=datadf[datadf["length_filter"]]["quals"],
-                    legacy=plotdict_legacy,
-                    names=['Read lengths', 'Average read quality'],
-                    path=settings["path"] + "LengthvsQualityScatterPlot",
-                    color=color,
-                    colormap=colormap,
-                    plots=plotdict,
-                    log=True,
-                    title=settings["title"],
-                    settings=settings)
-            )
-        logging.info("Created LengthvsQual plot")
+                settings=settings))
     if "channelIDs" in datadf:
-        plots.extend(
-            nanoplotter.spatial_heatmap(
-                array=datadf["channelIDs"],
-                title=settings["title"],
-                path=settings["path"] + "ActivityMap_ReadsPerChannel",
-                colormap=colormap,
-                settings=settings)
-        )
-        logging.info("Created spatialheatmap for succesfull basecalls.")
+        tasks.append(partial(
+            nanoplotter.spatial_heatmap,
+            array=datadf["channelIDs"],
+            title=settings["title"],
+            path=settings["path"] + "ActivityMap_ReadsPerChannel",
+            colormap=colormap,
+            settings=settings))
     if "start_time" in datadf:
-        plots.extend(
-            nanoplotter.time_plots(
+        def time_plots():
+            # both calls write the same yield plots, so they are made one after the other
+            plots = nanoplotter.time_plots(
                 df=datadf,
                 subsampled_df=subdf,
                 path=settings["path"],
                 color=color,
                 title=settings["title"],
                 settings=settings)
-        )
-        if settings["logBool"]:
-            plots.extend(
-                nanoplotter.time_plots(
-                    df=datadf,
-                    subsampled_df=subdf,
-                    path=settings["path"],
-                    color=color,
-                    title=settings["title"],
-                    log_length=True,
-                    settings=settings)
-            )
-        logging.info("Created timeplots.")
+            if settings["logBool"]:
+                plots.extend(
+                    nanoplotter.time_plots(
+                        df=datadf,
+                        subsampled_df=subdf,
+                        path=settings["path"],
+                        color=color,
+                        title=settings["title"],
+                        log_length=True,
+                        settings=settings)
+                )
+            return plots
+        tasks.append(time_plots)
     if "aligned_lengths" in datadf and "lengths" in datadf:
-        plots.extend(
-            nanoplotter.scatter(
-                x=datadf[datadf["length_filter"]]["aligned_lengths"],
-                y=datadf[datadf["length_filter"]]["lengths"],
-                legacy=plotdict_legacy,
-                names=["Aligned read lengths", "Sequenced read length"],
-                path=settings["path"] +
-                "AlignedReadlengthvsSequencedReadLength",
-                plots=plotdict,
-                color=color,
-                colormap=colormap,
-                title=settings["title"],
-                settings=settings)
-        )
-        logging.info("Created AlignedLength vs Length plot.")
+        tasks.append(partial(
+            nanoplotter.scatter,
+            x=fdf["aligned_lengths"],
+            y=fdf["lengths"],
+            legacy=plotdict_legacy,
+            names=["Aligned read lengths", "Sequenced read length"],
+            path=settings["path"] +
+            "AlignedReadlengthvsSequencedReadLength",
+            plots=plotdict,
+            color=color,
+            colormap=colormap,
+            title=settings["title"],
+            settings=settings))
     if "mapQ" in datadf and "quals" in datadf:
-        plots.extend(
-            nanoplotter.scatter(
-                x=datadf["mapQ"],
-                y=datadf["quals"],
+        tasks.append(partial(
+            nanoplotter.scatter,
+            x=datadf["mapQ"],
+            y=datadf["quals"],
+            legacy=plotdict_legacy,
+            names=["Read mapping quality", "Average basecall quality"],
+            path=settings["path"] + "MappingQualityvsAverageBaseQuality",
+            color=color,
+            colormap=colormap,
+            plots=plotdict,
+            title=settings["title"],
+            settings=settings))
+        mapq = fdf["mapQ"]
+        tasks.append(partial(
+            nanoplotter.scatter,
+            x=lengths,
+            y=mapq,
+            legacy=plotdict_legacy,
+            names=["Read length", "Read mapping quality"],
+            path=settings["path"] + "MappingQualityvsReadLength",
+            color=color,
+            colormap=colormap,
+            plots=plotdict,
+            title=settings["title"],
+            settings=settings))
+        if settings["logBool"]:
+            tasks.append(partial(
+                nanoplotter.scatter,
+                x=log_lengths,
+                y=mapq,
                 legacy=plotdict_legacy,
-                names=["Read mapping quality", "Average basecall quality"],
-                path=settings["path"] + "MappingQualityvsAverageBaseQuality",
+                names=["Read length", "Read mapping quality"],
+                path=settings["path"] + "MappingQualityvsReadLength",
                 color=color,
                 colormap=colormap,
                 plots=plotdict,
+                log=True,
                 title=settings["title"],
-                settings=settings)
-        )
-        logging.info("Created MapQvsBaseQ plot.")
-        plots.extend(
-            nanoplotter.scatter(
-                x=datadf[datadf["length_filter"]
-                         ][settings["lengths_pointer"].replace('log_', '')],
-                y=datadf[datadf["length_filter"]]["mapQ"],
+                settings=settings))
+    if "percentIdentity" in datadf:
+        all_percent_identity = datadf["percentIdentity"]
+        minPID = utils.lower_percentile(all_percent_identity, 1)
+        percent_identity = fdf["percentIdentity"]
+        if "aligned_quals" in datadf:
+            tasks.append(partial(
+                nanoplotter.scatter,
+                x=all_percent_identity,
+                y=datadf["aligned_quals"],
                 legacy=plotdict_legacy,
-                names=["Read length", "Read mapping quality"],
-                path=settings["path"] + "MappingQualityvsReadLength",
+                names=["Percent identity", "Average Base Quality"],
+                path=settings["path"] +
+                "PercentIdentityvsAverageBaseQuality",
                 color=color,
                 colormap=colormap,
                 plots=plotdict,
+                stat=stat,
+                minvalx=minPID,
                 title=settings["title"],
-                settings=settings)
-        )
+                settings=settings))
+        tasks.append(partial(
+            nanoplotter.scatter,
+            x=lengths,
+            y=percent_identity,
+            legacy=plotdict_legacy,
+            names=["Aligned read length", "Percent identity"],
+            path=settings["path"] + "PercentIdentityvsAlignedReadLength",
+            color=color,
+            colormap=colormap,
+            plots=plotdict,
+            stat=stat,
+            minvaly=minPID,
+            title=settings["title"],
+            settings=settings))
         if settings["logBool"]:
-            plots.extend(
-                nanoplotter.scatter(
-                    x=datadf[datadf["length_filter"]
-                             ][settings["lengths_pointer"]],
-                    y=datadf[datadf["length_filter"]]["mapQ"],
-                    legacy=plotdict_legacy,
-                    names=["Read length", "Read mapping quality"],
-                    path=settings["path"] + "MappingQualityvsReadLength",
-                    color=color,
-                    colormap=colormap,
-                    plots=plotdict,
-                    log=True,
-                    title=settings["title"],
-                    settings=settings)
-            )
-        logging.info("Created Mapping quality vs read length plot.")
-    if "percentIdentity" in datadf:
-        minPID = np.percentile(datadf["percentIdentity"], 1)
-        if "aligned_quals" in datadf:
-            plots.extend(
-                nanoplotter.scatter(
-                    x=datadf["percentIdentity"],
-                    y=datadf["aligned_quals"],
-                    legacy=plotdict_legacy,
-                    names=["Percent identity", "Average Base Quality"],
-                    path=settings["path"] +
-                    "PercentIdentityvsAverageBaseQuality",
-                    color=color,
-                    colormap=colormap,
-                    plots=plotdict,
-                    stat=stats.pearsonr if not settings["hide_stats"] else None,
-                    minvalx=minPID,
-                    title=settings["title"],
-                    settings=settings)
-            )
-            logging.info("Created Percent ID vs Base quality plot.")
-        plots.extend(
-            nanoplotter.scatter(
-                x=datadf[datadf["length_filter"]
-                         ][settings["lengths_pointer"].replace('log_', '')],
-                y=datadf[datadf["length_filter"]]["percentIdentity"],
+            tasks.append(partial(
+                nanoplotter.scatter,
+                x=log_lengths,
+                y=percent_identity,
                 legacy=plotdict_legacy,
                 names=["Aligned read length", "Percent identity"],
-                path=settings["path"] + "PercentIdentityvsAlignedReadLength",
+                path=settings["path"] +
+                "PercentIdentityvsAlignedReadLength",
                 color=color,
                 colormap=colormap,
                 plots=plotdict,
-                stat=stats.pearsonr if not settings["hide_stats"] else None,
+                stat=stat,
+                log=True,
                 minvaly=minPID,
                 title=settings["title"],
-                settings=settings)
-        )
-        if settings["logBool"]:
-            plots.extend(
-                nanoplotter.scatter(
-                    x=datadf[datadf["length_filter"]
-                             ][settings["lengths_pointer"]],
-                    y=datadf[datadf["length_filter"]]["percentIdentity"],
-                    legacy=plotdict_legacy,
-                    names=["Aligned read length", "Percent identity"],
-                    path=settings["path"] +
-                    "PercentIdentityvsAlignedReadLength",
-                    color=color,
-                    colormap=colormap,
-                    plots=plotdict,
-                    stat=stats.pearsonr if not settings["hide_stats"] else None,
-                    log=True,
-                    minvaly=minPID,
-                    title=settings["title"],
-                    settings=settings)
-            )
+                settings=settings))
+
+        tasks.append(lambda: [nanoplotter.dynamic_histogram(
+            array=all_percent_identity,
+            name="percent identity",
+            path=settings["path"] + "PercentIdentityHistogram",
+            title=settings["title"],
+            color=color,
+            settings=settings)])
 
-        plots.append(nanoplotter.dynamic_histogram(array=datadf["percentIdentity"],
-                                                   name="percent identity",
-                                                   path=settings["path"]
-                                                   + "PercentIdentityHistogram",
-                                                   title=settings["title"],
-                                                   color=color,
-                                                   settings=settings))
-        logging.info("Created Percent ID vs Length plot")
+    # matplotlib's pyplot used in legacy mode keeps global state and is not thread safe
+    workers = 1 if settings["legacy"] else min(8, settings["threads"])
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        plots = [p for task_plots in executor.map(lambda task: task(), tasks) for p in task_plots]
+    logging.info("Created {} plots".format(len(plots)))
     return plots
 
 
@@ -378,15 +534,17 @@ def make_report(plots, settings):
     '''
     logging.info("Writing html report.")
 
-    html_content = [
-        '<body class="grid">',
-        report.html_toc(plots, filtered=settings["filtered"]),
-        report.html_stats(settings),
-        report.html_plots(plots),
-        report.run_info(settings) if settings["info_in_report"] else '',
-        '</main></body></html>']
-    with open(settings["path"] + "NanoPlot-report.html", "w") as html_file:
-        html_file.write(report.html_head + '\n'.join(html_content))
+    with open(settings["path"] + "NanoPlot-report.html", "w", buffering=1 << 20) as html_file:
+        html_file.write(report.html_head)
+        html_file.write('<body class="grid">\n')
+        html_file.write(report.html_toc(plots, filtered=settings["filtered"]) + '\n')
+        html_file.write(report.html_stats(settings) + '\n')
+        for chunk in report.iter_html_plots(plots):
+            html_file.write(chunk)
+            html_file.write('\n')
+        if settings["info_in_report"]:
+            html_file.write(report.run_info(settings))
+        html_file.write('\n</main></body></html>')
 
 
 if __name__ == "__main__":
@@ -14,7 +14,12 @@ def phred_to_percent(phred):
 
 
 def non_filtered_reads(df):
-    return len(df[df["length_filter"]])
+    return int(df["length_filter"].sum())
+
+
+def length_filtered(df):
+    """Return the reads passing the length filter, selected by position."""
+    return df.take(np.flatnonzero(df["length_filter"].to_numpy()))
 
 
 def filter_and_transform_data(df, settings):
@@ -118,7 +123,9 @@ def filter_and_transform_data(df, settings):
         settings["filtered"] = True
 
     if settings.get("percentqual"):
-        df["quals"] = df["quals"].apply(phred_to_percent)
+        # assign to a new DataFrame: pandas<1.5 would overwrite the quals in place,
+        # which are shared with the data still being written in the background
+        df = df.assign(quals=df["quals"].apply(phred_to_percent))
         logging.info("Converting quality scores to theoretical percent identities.")
 
     return(df, settings)
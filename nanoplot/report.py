@@ -1,4 +1,3 @@
-import pandas as pd
 import numpy as np
 
 
@@ -47,6 +46,7 @@ def html_stats(settings):
 
 
 def stats2html(statsf):
+    import pandas as pd
     df = pd.read_csv(statsf, sep=':', header=None, names=['feature', 'value'])
     values = df["value"].str.strip().str.replace('\t', ' ').str.split().replace(np.nan, '')
     num = len(values[0]) or 1
@@ -82,20 +82,22 @@ def html_toc(plots, filtered=False):
 
 
 def html_plots(plots):
-    html_plots = []
-    html_plots.append('<h3 id="plots">Plots</h3>')
+    return '\n'.join(iter_html_plots(plots))
+
+
+def iter_html_plots(plots):
+    """Yield the html of the plots section piece by piece, to avoid joining all plots."""
+    yield '<h3 id="plots">Plots</h3>'
     for plot in plots:
-        html_plots.append('<button class="collapsible">' + plot.title + '</button>')
-        html_plots.append('<section class="collapsible-content"><h4 class="hiddentitle" id="' +
-                          plot.title.replace(' ', '_') + '">' + plot.title + '</h4>')
-        html_plots.append(plot.encode())
-        html_plots.append('</section>')
+        yield '<button class="collapsible">' + plot.title + '</button>'
+        yield ('<section class="collapsible-content"><h4 class="hiddentitle" id="' +
+               plot.title.replace(' ', '_') + '">' + plot.title + '</h4>')
+        yield plot.encode()
+        yield '</section>'
 
-    html_plots.append(
+    yield (
         '<script>var coll = document.getElementsByClassName("collapsible");var i;for (i = 0; i < coll.length; i++) {coll[i].addEventListener("click", function() {this.classList.toggle("active");var content = this.nextElementSibling;if (content.style.display === "none") {content.style.display = "block";} else {content.style.display = "none";}});}</script>')
 
-    return '\n'.join(html_plots)
-
 
 def run_info(settings):
     html_info = []
@@ -6,7 +6,21 @@ import logging
 from nanoplot.version import __version__
 from argparse import HelpFormatter, Action, ArgumentParser
 import textwrap as _textwrap
-import pandas as pd
+import numpy as np
+import pickle
+import struct
+import mmap
+
+# reads are binned per kb for get_N50, longer reads all end up in the last bin
+MAX_N50_BIN = 1 << 16
+
+# probability of a basecall error for each phred+33 encoded quality character
+PHRED_ERRORS = 10 ** (-(np.arange(256) - 33) / 10)
+
+# marks pickle files written by dump_pickle with out-of-band buffers
+PICKLE_MAGIC = b"NanoPlot-pickle5"
+# out-of-band buffers are aligned to this many bytes in the file, and thus in memory
+PICKLE_ALIGNMENT = 64
 
 
 class CustomHelpFormatter(HelpFormatter):
@@ -78,13 +92,23 @@ def get_args():
     )
     general.add_argument(
         "--store",
-        help="Store the extracted data in a pickle file for future plotting.",
+        help="Store the extracted data in a NanoPlot pickle (.nanopickle) and feather file "
+        "for future plotting.",
         action="store_true",
     )
     general.add_argument(
         "--raw", help="Store the extracted data in tab separated file.", action="store_true"
     )
-    general.add_argument("--huge", help="Input data is one very large file.", action="store_true")
+    general.add_argument(
+        "--raw_zstd",
+        help="Compress the tab separated file of --raw with zstd rather than gzip.",
+        action="store_true",
+    )
+    general.add_argument(
+        "--huge",
+        help="Input data is one very large file. Uses dnaio if installed for fastq, fasta or ubam.",
+        action="store_true",
+    )
     general.add_argument(
         "-o", "--outdir", help="Specify directory in which output has to be created.", default="."
     )
@@ -271,7 +295,11 @@ def get_args():
     mtarget.add_argument(
         "--cram", help="Data is in one or more sorted cram file(s).", nargs="+", metavar="file"
     )
-    mtarget.add_argument("--pickle", help="Data is a pickle file stored earlier.", metavar="pickle")
+    mtarget.add_argument(
+        "--pickle",
+        help="Data is a (nano)pickle file stored earlier.",
+        metavar="pickle",
+    )
     mtarget.add_argument(
         "--feather", help="Data is in one or more feather file(s).", nargs="+", metavar="file"
     )
@@ -336,11 +364,11 @@ def init_logs(args, tool="NanoPlot"):
 
 
 def subsample_datasets(df, minimal=10000):
+    import pandas as pd
     if "dataset" in df:
         list_df = []
 
-        for d in df["dataset"].unique():
-            dataset = df.loc[df["dataset"] == d]
+        for _, dataset in df.groupby("dataset", sort=False, observed=True):
 
             if len(dataset.index) < minimal:
                 list_df.append(dataset)
@@ -358,3 +386,98 @@ def subsample_datasets(df, minimal=10000):
             subsampled_df = df.sample(minimal)
 
     return subsampled_df
+
+
+def get_N50(lengths, minimal=10000):
+    """Return the read length N50 without sorting all reads.
+
+    Reads are binned per kb weighted by their length, and only the reads in the bin
+    in which the cumulative yield crosses half of the total are sorted.
+    Small datasets are sorted entirely and passed to nanomath.get_N50.
+    """
+    lengths = np.ascontiguousarray(lengths, dtype=np.int64)
+    if len(lengths) < minimal:
+        import nanomath
+        return nanomath.get_N50(np.sort(lengths))
+    bins = np.minimum(lengths >> 10, MAX_N50_BIN)
+    cumyield = np.cumsum(np.bincount(bins, weights=lengths))
+    half = 0.5 * cumyield[-1]
+    crossing = np.searchsorted(cumyield, half)
+    offset = cumyield[crossing - 1] if crossing else 0
+    inbin = np.sort(lengths[bins == crossing])
+    return inbin[np.searchsorted(offset + np.cumsum(inbin), half)]
+
+
+def lower_percentile(values, percent):
+    """Return the value at the given percentile without interpolation.
+
+    Equivalent to np.quantile(values, percent / 100, method="lower"), which needs numpy>=1.22,
+    using a partial sort (np.partition) rather than sorting all values.
+    """
+    values = np.asarray(values)
+    k = int(percent / 100 * (len(values) - 1))
+    return np.partition(values, k)[k]
+
+
+def integer_lengths(lengths):
+    """Return the lengths as 64 bit integers, only casting (and copying) if needed.
+
+    Narrower integers would overflow in the length weighted histograms.
+    """
+    if lengths.dtype.kind in "iu" and lengths.dtype.itemsize == 8:
+        return lengths
+    return lengths.astype("uint64")
+
+
+def dump_pickle(obj, path):
+    """Pickle obj to path, writing the numpy buffers out-of-band.
+
+    The file contains the magic bytes, the pickle stream and the raw buffers,
+    each preceded by their length and padded to PICKLE_ALIGNMENT,
+    so the buffers are not copied into the stream.
+    This is not a regular pickle file, use load_pickle to read it.
+    """
+    buffers = []
+    data = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    with open(path, "wb") as fh:
+        fh.write(PICKLE_MAGIC)
+        fh.write(struct.pack("<QQ", len(data), len(buffers)))
+        fh.write(data)
+        for buf in buffers:
+            raw = buf.raw()
+            fh.write(struct.pack("<Q", raw.nbytes))
+            fh.write(b"\0" * (-fh.tell() % PICKLE_ALIGNMENT))
+            fh.write(raw)
+
+
+def load_pickle(path):
+    """Load a pickle file written by dump_pickle, or a regular pickle file.
+
+    The out-of-band buffers are memory mapped copy-on-write rather than read.
+    """
+    with open(path, "rb") as fh:
+        if fh.read(len(PICKLE_MAGIC)) != PICKLE_MAGIC:
+            fh.seek(0)
+            return pickle.load(fh)
+        mapped = memoryview(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_COPY))
+    offset = len(PICKLE_MAGIC)
+    size, nbuffers = struct.unpack_from("<QQ", mapped, offset)
+    offset += 16
+    data = mapped[offset:offset + size]
+    offset += size
+    buffers = []
+    for _ in range(nbuffers):
+        (size,) = struct.unpack_from("<Q", mapped, offset)
+        offset += 8
+        offset += -offset % PICKLE_ALIGNMENT
+        buffers.append(mapped[offset:offset + size])
+        offset += size
+    return pickle.loads(data, buffers=buffers)
+
+
+def ave_qual(qualities):
+    """Return the average quality of phred+33 encoded qualities as bytes.
+
+    The average is taken of the error probabilities, as nanomath.ave_qual does.
+    """
+    return -10 * np.log10(PHRED_ERRORS[np.frombuffer(qualities, dtype=np.uint8)].mean())
@@ -88,9 +88,11 @@ def scatter(x, y, legacy, names, path, plots, color, colormap, settings, stat=No
     if not contains_variance([x, y], names):
         return []
     plots_made = []
-    idx = np.random.choice(x.index, min(10000, len(x)), replace=False)
-    maxvalx = xmax or np.amax(x[idx])
-    maxvaly = ymax or np.amax(y[idx])
+    # subsample once for all plots, Generator.choice doesn't shuffle all reads to do so
+    idx = np.random.default_rng().choice(len(x), min(10000, len(x)), replace=False)
+    x, y = x.iloc[idx], y.iloc[idx]
+    maxvalx = xmax or np.amax(x)
+    maxvaly = ymax or np.amax(y)
 
     if plots["dot"]:
         if log:
@@ -103,7 +105,7 @@ def scatter(x, y, legacy, names, path, plots, color, colormap, settings, stat=No
                 path=path + "_dot.html",
                 title=f"{names[0]} vs {names[1]} plot using dots")
 
-        fig = px.scatter(x=x[idx], y=y[idx], marginal_x="histogram", marginal_y="histogram",
+        fig = px.scatter(x=x, y=y, marginal_x="histogram", marginal_y="histogram",
                          range_x=[minvalx, maxvalx], range_y=[minvaly, maxvaly])
         fig.update_traces(marker=dict(color=color))
         fig.update_yaxes(rangemode="tozero")
@@ -138,7 +140,7 @@ def scatter(x, y, legacy, names, path, plots, color, colormap, settings, stat=No
             title=f"{names[0]} vs {names[1]} kde plot")
 
         col = hex_to_rgb_scale_0_1(color)
-        fig = ff.create_2d_density(x[idx], y[idx], point_size=3,
+        fig = ff.create_2d_density(x, y, point_size=3,
                                    hist_color=col,
                                    point_color=col,
                                    colorscale=colormap)
@@ -169,8 +171,8 @@ def scatter(x, y, legacy, names, path, plots, color, colormap, settings, stat=No
 
     if 1 in legacy.values():
         settings, args = utils.get_args()
-        plots_made += scatter_legacy(x=x[idx],
-                                     y=y[idx],
+        plots_made += scatter_legacy(x=x,
+                                     y=y,
                                      names=names,
                                      path=path,
                                      plots=legacy,
@@ -291,7 +293,7 @@ def scatter_legacy(x, y, names, path, plots, color, settings,
 
     if plots["kde"]:
         if len(x) > 2:
-            idx = np.random.choice(x.index, min(2000, len(x)), replace=False)
+            idx = np.random.default_rng().choice(len(x), min(2000, len(x)), replace=False)
             if log:
                 kde_plot = Plot(
                     path=path + "_loglength_kde." + figformat,
@@ -302,8 +304,8 @@ def scatter_legacy(x, y, names, path, plots, color, settings,
                     path=path + "_kde." + figformat,
                     title=f"{names[0]} vs {names[1]} plot using a kernel density estimation")
             plot = sns.jointplot(
-                x=x[idx],
-                y=y[idx],
+                x=x.iloc[idx],
+                y=y.iloc[idx],
                 kind="kde",
                 clip=((0, np.Inf), (0, np.Inf)),
                 xlim=(minvalx, maxvalx),
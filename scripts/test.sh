@@ -51,6 +51,11 @@ NanoPlot --fastq nanotest/reads.fastq.gz --verbose --minqual 4 --color red -o te
 echo ""
 echo ""
 echo ""
+echo "testing fastq plain with --huge:"
+NanoPlot --fastq nanotest/reads.fastq.gz --verbose --huge -o tests
+echo ""
+echo ""
+echo ""
 echo "testing fasta:"
 NanoPlot --fasta nanotest/reads.fa.gz --verbose --maxlength 35000 -o tests
 echo ""